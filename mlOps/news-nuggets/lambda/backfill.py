@@ -0,0 +1,440 @@
+import json
+import sys
+import time
+import threading
+import boto3
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+TABLE_NAME = "NewsArticles"
+BUCKET_NAME = "news-nuggets-bucket"
+CHECKPOINT_PREFIX = "backfill"
+# defaults match consumer.py, pass model / system_prompt in the event to backfill with a new prompt
+MODEL = "gpt-4o"
+SYSTEM_PROMPT = "You are a professional news analyst that provides a summary of a news article and a one word describing the category to which the news belongs to. The format should be as follows:| Summary: lorem ipsum | Category: lorem"
+MAX_TOKENS = 500
+REQUEST_TIMEOUT_SECONDS = 60
+# rough estimates used by the dry run
+CHARS_PER_TOKEN = 4
+EXPECTED_COMPLETION_TOKENS = 150
+# prompt and completion prices in USD per 1K tokens, a dry run only accepts models listed here
+MODEL_PRICES = {
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4.1": (0.002, 0.008),
+    "gpt-4.1-mini": (0.0004, 0.0016),
+}
+# stop picking up new pages and retries when the lambda is this close to its timeout,
+# it covers the page budget below plus one more request that runs into its timeout
+SAFETY_MARGIN_MS = 120000
+# pages are sized so the rate limited LLM calls of one round of pages take at most this long,
+# the rest of the safety margin covers a request that runs into its timeout
+PAGE_BUDGET_SECONDS = 30
+DRY_RUN_PAGE_SIZE = 100
+# 429s and 5xx from the LLM API are retried with exponential backoff
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 2
+
+def lambda_handler(event, context):
+    # event options:
+    #   source: "dynamodb" (default) re-summarizes NewsArticles rows, "s3" re-summarizes archived news.json dumps
+    #   run_id: name of the checkpoint, reuse it to resume a stopped run
+    #   total_segments: number of parallel scan segments for dynamodb, fixed for the lifetime of a run_id
+    #   prefix: s3 prefix holding the dumps
+    #   page_size: articles per page, capped so a page always finishes before the lambda timeout
+    #   max_workers: number of concurrent LLM calls
+    #   requests_per_minute: global rate limit for the LLM API
+    #   model / system_prompt: override the summarize_categorize model and prompt
+    #   retry_failed: only retry the articles recorded as failed in the checkpoint
+    #   dry_run: only read the data and report throughput and estimated token cost
+    try:
+        options = get_options(event)
+    except (TypeError, ValueError) as e:
+        return {"statusCode": 400, "body": json.dumps(str(e))}
+
+    s3 = boto3.client("s3")
+    checkpoint = {} if options["dry_run"] else load_checkpoint(s3, options["run_id"])
+    if options["source"] == "dynamodb" and not options["retry_failed"]:
+        total_segments = checkpoint.setdefault("total_segments", options["total_segments"])
+        if total_segments != options["total_segments"]:
+            return {
+                "statusCode": 400,
+                "body": json.dumps(f"Run {options['run_id']} was started with total_segments={total_segments}")
+            }
+
+    stats = {"scanned": 0, "updated": 0, "failed": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    job = {
+        "run_id": options["run_id"],
+        "dry_run": options["dry_run"],
+        "model": options["model"],
+        "system_prompt": options["system_prompt"],
+        "page_size": options["page_size"],
+        "context": context,
+        "checkpoint": checkpoint,
+        "stats": stats,
+        "s3": s3,
+        "lock": threading.Lock(),
+        "rate_limiter": RateLimiter(options["requests_per_minute"]),
+        "api_key": None if options["dry_run"] else get_secret("OPEN_AI_KEY"),
+    }
+
+    start = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=options["max_workers"]) as llm_pool:
+            job["llm_pool"] = llm_pool
+            if options["retry_failed"]:
+                complete = retry_failed(job)
+            elif options["source"] == "dynamodb":
+                complete = backfill_dynamodb(job, options["total_segments"])
+            else:
+                complete = backfill_s3(job, options["prefix"])
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps(str(e))
+        }
+
+    report = get_report(stats, time.time() - start, options["requests_per_minute"], options["dry_run"], options["model"])
+    report["complete"] = complete
+    report["failed_pending"] = len(checkpoint.get("failed", []))
+    # 202 tells the caller to invoke again with the same run_id to resume
+    return {
+        "statusCode": 200 if complete else 202,
+        "body": json.dumps(report)
+    }
+
+def get_options(event):
+    options = {
+        "source": event.get("source", "dynamodb"),
+        "run_id": event.get("run_id", "default"),
+        "dry_run": get_bool_option(event, "dry_run"),
+        "retry_failed": get_bool_option(event, "retry_failed"),
+        "prefix": event.get("prefix", "scrapped_news/"),
+        "model": event.get("model", MODEL),
+        "system_prompt": event.get("system_prompt", SYSTEM_PROMPT),
+        "total_segments": int(event.get("total_segments", 4)),
+        "max_workers": int(event.get("max_workers", 4)),
+        "requests_per_minute": int(event.get("requests_per_minute", 60)),
+    }
+    if options["source"] not in ("dynamodb", "s3"):
+        raise ValueError(f"Unknown source: {options['source']}")
+    if options["dry_run"] and options["model"] not in MODEL_PRICES:
+        raise ValueError(f"No pricing for model {options['model']}, add it to MODEL_PRICES to estimate the cost")
+    for name in ("total_segments", "max_workers", "requests_per_minute"):
+        if options[name] <= 0:
+            raise ValueError(f"{name} must be a positive number")
+
+    # every segment has a page in flight at the same time, all of them share the rate limit
+    parallel_pages = options["total_segments"] if options["source"] == "dynamodb" else 1
+    if options["dry_run"]:
+        max_page_size = DRY_RUN_PAGE_SIZE
+    else:
+        max_page_size = max(1, PAGE_BUDGET_SECONDS * options["requests_per_minute"] // 60 // parallel_pages)
+    options["page_size"] = min(int(event.get("page_size", max_page_size)), max_page_size)
+    if options["page_size"] <= 0:
+        raise ValueError("page_size must be a positive number")
+    return options
+
+def get_bool_option(event, name):
+    # console and cli invocations may send booleans as strings
+    value = event.get(name, False)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    raise ValueError(f"{name} must be true or false")
+
+def backfill_dynamodb(job, total_segments):
+    segments = job["checkpoint"].setdefault("segments", {})
+    for segment in range(total_segments):
+        segments.setdefault(str(segment), {"last_key": None, "done": False})
+    with ThreadPoolExecutor(max_workers=total_segments) as scan_pool:
+        results = list(scan_pool.map(lambda segment: scan_segment(job, segment, total_segments, segments), range(total_segments)))
+    return all(results)
+
+def scan_segment(job, segment, total_segments, segments):
+    # the default boto3 session is not thread safe, every scan thread gets its own
+    table = boto3.session.Session().resource('dynamodb').Table(TABLE_NAME)
+    state = segments[str(segment)]
+    while not state["done"]:
+        if out_of_time(job["context"]):
+            return False
+        scan_kwargs = {"Segment": segment, "TotalSegments": total_segments, "Limit": job["page_size"]}
+        if state["last_key"]:
+            scan_kwargs["ExclusiveStartKey"] = state["last_key"]
+        response = table.scan(**scan_kwargs)
+
+        items = response.get("Items", [])
+        results = process_items(job, items)
+        if not job["dry_run"]:
+            write_items(table, [item for item, ok in zip(items, results) if ok])
+
+        with job["lock"]:
+            add_failed(job, [get_item_key(item) for item, ok in zip(items, results) if not ok])
+            state["last_key"] = response.get("LastEvaluatedKey")
+            state["done"] = state["last_key"] is None
+        save_checkpoint(job)
+    return True
+
+def backfill_s3(job, prefix):
+    s3 = job["s3"]
+    checkpoint = job["checkpoint"]
+    done_keys = set(checkpoint.setdefault("done_keys", []))
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            # only the scraper dumps, not the watermark or other files stored next to them
+            if not key.endswith("/news.json") or key in done_keys:
+                continue
+            if out_of_time(job["context"]):
+                return False
+
+            # a partly processed dump continues from its re-summarized copy
+            current = checkpoint.get("current") or {}
+            offset = current.get("offset", 0) if current.get("key") == key else 0
+            articles = read_json(s3, get_output_key(job, key) if offset else key)
+            if not isinstance(articles, list) or not all(isinstance(article, dict) for article in articles):
+                print(f"Skipping {key}, it is not a list of articles")
+                articles = []
+
+            while offset < len(articles):
+                if out_of_time(job["context"]):
+                    return False
+                chunk = articles[offset:offset + job["page_size"]]
+                results = process_items(job, chunk)
+                if not job["dry_run"]:
+                    # keep the original dump untouched and write the re-summarized copy next to the checkpoint,
+                    # articles that failed to summarize are copied as they were
+                    write_json(s3, get_output_key(job, key), articles)
+                with job["lock"]:
+                    add_failed(job, [{"key": key, "index": offset + i} for i, ok in enumerate(results) if not ok])
+                    offset += len(chunk)
+                    checkpoint["current"] = {"key": key, "offset": offset}
+                save_checkpoint(job)
+
+            done_keys.add(key)
+            with job["lock"]:
+                checkpoint["done_keys"] = sorted(done_keys)
+                checkpoint["current"] = None
+            save_checkpoint(job)
+    return True
+
+def retry_failed(job):
+    # failed entries are either dynamodb keys or {"key": dump, "index": position} for s3 dumps
+    checkpoint = job["checkpoint"]
+    table = boto3.session.Session().resource('dynamodb').Table(TABLE_NAME)
+    retried = 0
+    while retried < len(checkpoint.get("failed", [])):
+        if out_of_time(job["context"]):
+            return False
+        chunk = checkpoint["failed"][retried:retried + job["page_size"]]
+        dumps = {}
+        items = []
+        for entry in chunk:
+            if "key" in entry:
+                if entry["key"] not in dumps:
+                    dumps[entry["key"]] = read_json(job["s3"], get_output_key(job, entry["key"]))
+                items.append(dumps[entry["key"]][entry["index"]])
+            else:
+                items.append(table.get_item(Key=entry).get("Item"))
+        found = [item for item in items if item is not None]
+        results = iter(process_items(job, found))
+        still_failed = [entry for entry, item in zip(chunk, items) if item is not None and not next(results)]
+
+        write_items(table, [item for entry, item in zip(chunk, items) if "key" not in entry and item is not None])
+        for key, articles in dumps.items():
+            write_json(job["s3"], get_output_key(job, key), articles)
+        with job["lock"]:
+            checkpoint["failed"][retried:retried + len(chunk)] = still_failed
+        retried += len(still_failed)
+        save_checkpoint(job)
+    return True
+
+def process_items(job, items):
+    # returns whether each item was re-summarized
+    with job["lock"]:
+        job["stats"]["scanned"] += len(items)
+    if job["dry_run"]:
+        for item in items:
+            estimate_tokens(job, item)
+        return [True] * len(items)
+    return list(job["llm_pool"].map(lambda item: resummarize(job, item), items))
+
+def resummarize(job, item):
+    for attempt in range(MAX_RETRIES + 1):
+        job["rate_limiter"].wait()
+        try:
+            res = summarize_categorize(job["api_key"], job["model"], job["system_prompt"],
+                                       item.get("title", ""), item.get("description", ""), item.get("content", ""))
+        except (IndexError, KeyError, ValueError) as e:
+            # the model answered in an unexpected format, retrying right away will not help
+            res = {"statusCode": 422, "body": json.dumps({"error": str(e)})}
+        if res["statusCode"] == 200 or not is_retryable(res["statusCode"]) or attempt == MAX_RETRIES:
+            break
+        # leave the article for retry_failed rather than letting the lambda timeout kill the invocation
+        if out_of_time(job["context"]):
+            break
+        time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+    with job["lock"]:
+        if res["statusCode"] != 200:
+            print(f"Failed to summarize {item.get('article_id', item.get('title', ''))}: {res['body']}")
+            job["stats"]["failed"] += 1
+            return False
+        job["stats"]["updated"] += 1
+    item["summary"] = res["summary"]
+    item["category"] = res["category"]
+    return True
+
+def is_retryable(status_code):
+    return status_code == 429 or status_code >= 500
+
+def add_failed(job, entries):
+    # callers hold job["lock"]
+    if entries and not job["dry_run"]:
+        job["checkpoint"].setdefault("failed", []).extend(entries)
+
+def get_item_key(item):
+    return {"article_id": item["article_id"], "publishedAt": item["publishedAt"]}
+
+def write_items(table, items):
+    if not items:
+        return
+    with table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+
+def get_output_key(job, key):
+    return f"{CHECKPOINT_PREFIX}/{job['run_id']}/{key}"
+
+def read_json(s3, key):
+    return json.loads(s3.get_object(Bucket=BUCKET_NAME, Key=key)["Body"].read().decode("utf-8"))
+
+def write_json(s3, key, data):
+    json_bytes = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=json_bytes)
+
+def estimate_tokens(job, item):
+    text = f"{job['system_prompt']}{item.get('title', '')} - {item.get('description', '')} - {item.get('content', '')}"
+    with job["lock"]:
+        job["stats"]["prompt_tokens"] += len(text) // CHARS_PER_TOKEN
+        job["stats"]["completion_tokens"] += EXPECTED_COMPLETION_TOKENS
+
+def get_report(stats, elapsed, requests_per_minute, dry_run, model):
+    report = dict(stats)
+    report["elapsed_seconds"] = round(elapsed, 2)
+    report["items_per_second"] = round(stats["scanned"] / elapsed, 2) if elapsed else 0
+    if dry_run:
+        prompt_price, completion_price = MODEL_PRICES[model]
+        report["model"] = model
+        report["estimated_cost_usd"] = round(
+            stats["prompt_tokens"] / 1000 * prompt_price
+            + stats["completion_tokens"] / 1000 * completion_price, 4)
+        # the LLM rate limit, not the scan, bounds how long the real run takes
+        report["estimated_run_minutes"] = round(stats["scanned"] / requests_per_minute, 2)
+    return report
+
+def out_of_time(context):
+    return context is not None and context.get_remaining_time_in_millis() < SAFETY_MARGIN_MS
+
+class RateLimiter:
+    # spaces out calls evenly across all threads so the whole run stays under requests_per_minute
+    def __init__(self, requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.interval = 60.0 / requests_per_minute
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0, slot - now))
+
+def get_checkpoint_key(run_id):
+    return f"{CHECKPOINT_PREFIX}/{run_id}/checkpoint.json"
+
+def load_checkpoint(s3, run_id):
+    try:
+        return read_json(s3, get_checkpoint_key(run_id))
+    except ClientError as e:
+        print(f"No checkpoint found for {run_id}, starting from the beginning: {e}")
+        return {}
+
+def save_checkpoint(job):
+    if job["dry_run"]:
+        return
+    with job["lock"]:
+        body = json.dumps(job["checkpoint"]).encode('utf-8')
+        job["s3"].put_object(Bucket=BUCKET_NAME, Key=get_checkpoint_key(job["run_id"]), Body=body)
+
+def summarize_categorize(openAIKey, model, system_prompt, title, description, content):
+    url = "https://api.openai.com/v1/chat/completions"
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {openAIKey}"
+    }
+
+    payload = {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": f"{title} - {description} - {content}"
+            }
+        ],
+        "max_tokens": MAX_TOKENS,
+        "temperature": 0.7
+    }
+
+    try:
+        response = requests.post(url, headers=headers, json=payload, timeout=REQUEST_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        result = response.json()
+        required = result['choices'][0]['message']['content'].split('|')
+        summary = required[1].split(':')[1].strip()
+        category = required[2].split(':')[1].strip()
+        return {
+            "statusCode": 200,
+            "summary": summary,
+            "category": category
+        }
+    except requests.exceptions.RequestException as e:
+        # keep the http status so the caller can tell rate limits and outages from bad requests,
+        # connection errors and timeouts count as the service being unavailable
+        return {
+            "statusCode": e.response.status_code if e.response is not None else 503,
+            "body": json.dumps({"error": str(e)})
+        }
+
+def get_secret(keyName):
+    secret_name = "apikeys"
+    region_name = "us-east-1"
+
+    session = boto3.session.Session()
+    client = session.client(
+        service_name='secretsmanager',
+        region_name=region_name
+    )
+
+    try:
+        get_secret_value_response = client.get_secret_value(
+            SecretId=secret_name
+        )
+    except ClientError as e:
+        raise e
+
+    secret = json.loads(get_secret_value_response['SecretString'])
+    return secret[keyName]
+
+if __name__ == "__main__":
+    # run locally without the lambda timeout, e.g. python backfill.py '{"dry_run": true}'
+    print(lambda_handler(json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}, None))
@@ -5,60 +5,224 @@ import re
 import bs4
 from bs4 import BeautifulSoup
 from requests.exceptions import RequestException
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from botocore.exceptions import ClientError
 import time
 import boto3
-from datetime import datetime
+from datetime import datetime, timezone, timedelta
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin
+import xml.etree.ElementTree as ET
 import html
 from io import BytesIO
 
+BASE_URL = "https://www.bangkokpost.com"
+LATEST_NEWS_URL = "https://www.bangkokpost.com/most-recent"
+# lightweight feeds tried in order before falling back to the listing page
+FEED_URLS = [
+    "https://www.bangkokpost.com/rss/data/most-recent.xml",
+    "https://www.bangkokpost.com/sitemap_news.xml",
+]
+FEED_ROOTS = ("rss", "RDF", "feed", "urlset")
+# each article costs the 5 second sleep plus the fetch, keep a run well inside the 180 second lambda timeout
+MAX_ARTICLES_PER_RUN = 20
+# stop before the timeout with room for one more sleep and a 30 second fetch
+SAFETY_MARGIN_MS = 40000
+BANGKOK_TZ = timezone(timedelta(hours=7))
+BUCKET_NAME = "news-nuggets-bucket"
+WATERMARK_KEY = "scrapped_news/watermark.json"
+
 def lambda_handler(event, context):
     try:
-    # scrape latest news from Bangkok Post
-        latest_news_url = "https://www.bangkokpost.com/most-recent"
-        response = safe_get(latest_news_url)
-        if response is not None:
-            soup = BeautifulSoup(response.text, "html.parser")
-            figures = soup.find("div", class_="page--link").find_all("figure")
-            
-            # get the latest news links
-            links=[]
-            for figure in figures:
-                link = figure.find("a")
-                if link:
-                    href = link.get("href")
-                    if href:
-                        links.append(href.strip())
-            links = list(set(links))
-            
-            # get data from each link
-            news=[]
-            sleep_for=5 # sleep for 5 seconds between requests to simulate human behavior
-            for link in links:
-                time.sleep(sleep_for)
-                target="https://www.bangkokpost.com" + link
-                response= safe_get(target)
-                if response is not None:
-                    soup = BeautifulSoup(response.text, "html.parser")
-                    if(soup.find("div", class_="article-content") is None):
-                        continue
-                    data = get_data(soup)
-                    news.append(data)
-                else:
-                    raise Exception("Failed to fetch a page")
-            for news_data in news:
-                news_data['title'] = clean_text(news_data['title'])
-                news_data['description'] = clean_text(news_data['description'])
-                news_data['content'] = clean_text(news_data['content'])
-            # save_to_s3(news)
-            send_to_kinesis(news)
+        watermark = get_watermark()
+        # prefer RSS/sitemap feeds, scrape the listing page only if none is available
+        entries = discover_from_feeds(watermark)
+        if entries is None:
+            entries = discover_from_listing()
+            if entries is None:
+                raise Exception("Failed to fetch the latest news links.")
+            from_feed = False
         else:
-            raise Exception("Failed to fetch the latest news links.")
+            from_feed = True
+            # feed entries come oldest first so whatever does not fit in this run
+            # is still newer than the watermark and gets picked up by the next one
+            entries = entries[:MAX_ARTICLES_PER_RUN]
+
+        # get data from each link, the listing page has no dates so it relies on the time check alone
+        sleep_for=5 # sleep for 5 seconds between requests to simulate human behavior
+        for link, published_at in entries:
+            if out_of_time(context):
+                break
+            time.sleep(sleep_for)
+            news_data = get_article(link, published_at)
+            if news_data is not None:
+                # save_to_s3([news_data])
+                send_to_kinesis([news_data])
+            # move the watermark after every feed article, including the ones that failed,
+            # so a timed out run keeps its progress and a broken page does not block the next runs
+            if from_feed:
+                watermark = advance_watermark(watermark, link, published_at)
+                save_watermark(watermark)
     except Exception as e:
         return {
             'statusCode': 500,
             'body': json.dumps(str(e))
         }
 
+def get_article(link, published_at):
+    target=urljoin(BASE_URL, link)
+    response= safe_get(target)
+    if response is None:
+        return None
+    try:
+        soup = BeautifulSoup(response.text, "html.parser")
+        if(soup.find("div", class_="article-content") is None):
+            return None
+        news_data = get_data(soup, published_at)
+        news_data['title'] = clean_text(news_data['title'])
+        news_data['description'] = clean_text(news_data['description'])
+        news_data['content'] = clean_text(news_data['content'])
+        return news_data
+    except (AttributeError, TypeError, KeyError, IndexError, ValueError) as e:
+        print(f"Error reading {target}: {e}")
+        return None
+
+def discover_from_feeds(watermark):
+    for feed_url in FEED_URLS:
+        entries = parse_feed(feed_url, watermark)
+        if entries is not None:
+            return entries
+    return None
+
+def parse_feed(feed_url, watermark):
+    # stream the feed through iterparse so we stop downloading once we reach already seen items,
+    # returns the new entries oldest first
+    try:
+        response = requests.get(feed_url, timeout=30, stream=True)
+        response.raise_for_status()
+    except RequestException as e:
+        print(f"Error fetching {feed_url}: {e}")
+        return None
+
+    entries = []
+    root = None
+    try:
+        response.raw.decode_content = True
+        for event, elem in ET.iterparse(response.raw, events=("start", "end")):
+            tag = local_name(elem.tag)
+            if event == "start":
+                if root is None:
+                    root = tag
+                    if root not in FEED_ROOTS:
+                        print(f"{feed_url} is not a feed")
+                        return None
+                continue
+            if tag not in ("item", "entry", "url"):
+                continue
+            link, published_at = get_feed_entry(elem)
+            elem.clear()
+            # undated entries can not be tracked by the watermark and would be sent again on every run
+            if not link or not published_at:
+                continue
+            if is_seen(watermark, link, published_at):
+                continue
+            if watermark["publishedAt"] and published_at < watermark["publishedAt"]:
+                # rss/atom feeds are newest first, news sitemaps have no guaranteed order
+                if root == "urlset":
+                    continue
+                break
+            entries.append((link, published_at))
+    except (ET.ParseError, Urllib3HTTPError, OSError) as e:
+        print(f"Error parsing {feed_url}: {e}")
+        return None
+    finally:
+        response.close()
+    return sorted(dict.fromkeys(entries), key=lambda entry: entry[1])
+
+def get_feed_entry(elem):
+    link = ""
+    published_at = ""
+    for child in elem.iter():
+        tag = local_name(child.tag)
+        if tag in ("link", "loc") and not link:
+            # atom links keep the url in href, rss/sitemap links in the text
+            link = (child.get("href") or child.text or "").strip()
+        elif tag in ("pubDate", "published", "updated", "publication_date") and not published_at:
+            published_at = parse_feed_date((child.text or "").strip())
+    return link, published_at
+
+def parse_feed_date(value):
+    if not value:
+        return ""
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return ""
+    # article pages are dated in Bangkok time, keep the feed dates consistent with them
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(BANGKOK_TZ)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+def out_of_time(context):
+    return context is not None and context.get_remaining_time_in_millis() < SAFETY_MARGIN_MS
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+def discover_from_listing():
+    # scrape latest news from Bangkok Post
+    response = safe_get(LATEST_NEWS_URL)
+    if response is None:
+        return None
+    soup = BeautifulSoup(response.text, "html.parser")
+    figures = soup.find("div", class_="page--link").find_all("figure")
+
+    # get the latest news links
+    links=[]
+    for figure in figures:
+        link = figure.find("a")
+        if link:
+            href = link.get("href")
+            if href:
+                links.append(href.strip())
+    # keep the page order, newest first
+    links = list(dict.fromkeys(links))
+    return [(link, "") for link in links]
+
+def is_seen(watermark, link, published_at):
+    if not watermark["publishedAt"]:
+        return False
+    if published_at < watermark["publishedAt"]:
+        return True
+    # several articles can share a timestamp, only skip the ones already processed at it
+    return published_at == watermark["publishedAt"] and link in watermark["links"]
+
+def advance_watermark(watermark, link, published_at):
+    if watermark["publishedAt"] is None or published_at > watermark["publishedAt"]:
+        return {"publishedAt": published_at, "links": [link]}
+    if published_at == watermark["publishedAt"] and link not in watermark["links"]:
+        return {"publishedAt": published_at, "links": watermark["links"] + [link]}
+    return watermark
+
+def get_watermark():
+    # newest feed publishedAt processed so far and the links processed at exactly that time
+    s3 = boto3.client("s3")
+    try:
+        response = s3.get_object(Bucket=BUCKET_NAME, Key=WATERMARK_KEY)
+    except ClientError as e:
+        print(f"No watermark found: {e}")
+        return {"publishedAt": None, "links": []}
+    watermark = json.loads(response['Body'].read().decode('utf-8'))
+    return {"publishedAt": watermark.get("publishedAt"), "links": watermark.get("links", [])}
+
+def save_watermark(watermark):
+    s3 = boto3.client("s3")
+    body = json.dumps(watermark).encode('utf-8')
+    s3.put_object(Bucket=BUCKET_NAME, Key=WATERMARK_KEY, Body=body)
+
 def send_to_kinesis(news_list):
     kinesis = boto3.client('kinesis')
     stream_name = 'news-stream'
@@ -75,7 +239,7 @@ def save_to_s3(result):
     json_bytes = json.dumps(result, ensure_ascii=False, indent=2).encode('utf-8')
     json_buffer = BytesIO(json_bytes)
     s3 = boto3.client("s3")
-    bucket_name = "news-nuggets-bucket"
+    bucket_name = BUCKET_NAME
     subfolder = "scrapped_news"
     current_date = datetime.now().strftime("%Y-%m-%d")
     subfolder = f"{subfolder}/{current_date}"
@@ -94,7 +258,7 @@ def safe_get(url):
         print(f"Error fetching {url}: {e}")
         return None
 
-def get_data(soup):
+def get_data(soup, published_at=""):
     title=soup.find("meta", {"property": "og:title"})["content"]
     if title:
         title = title.strip()
@@ -129,14 +293,18 @@ def get_data(soup):
         paragraph_texts = [p.get_text() for p in paragraphs]
         content=" ".join(paragraph_texts).strip()
     
-    info=soup.find("div", class_="article-info--col").find_all("p")[0].get_text()
-    if info:
-        info=info[info.find(":") + 1:].strip()
-        publish_date, publish_time=info.split("at")
-        dt = datetime.strptime(f"{publish_date} {publish_time}", "%d %b %Y %H:%M")
-        dt=dt.strftime("%Y-%m-%d %H:%M:%S")
+    if published_at:
+        # feeds already give us the publish date, no need to parse the article info block
+        dt = published_at
     else:
-        dt = ""
+        info=soup.find("div", class_="article-info--col").find_all("p")[0].get_text()
+        if info:
+            info=info[info.find(":") + 1:].strip()
+            publish_date, publish_time=info.split("at")
+            dt = datetime.strptime(f"{publish_date} {publish_time}", "%d %b %Y %H:%M")
+            dt=dt.strftime("%Y-%m-%d %H:%M:%S")
+        else:
+            dt = ""
     return {
         "title": title,
         "description": description,
@@ -65,6 +65,19 @@ resource "aws_lambda_function" "get_news_api" {
   layers           = [local.layer_arn]
 }
 
+# re-summarizes existing articles, invoke again with the same run_id while it returns 202
+resource "aws_lambda_function" "backfill" {
+  function_name    = "backfill"
+  filename         = "backfill.zip"
+  handler          = "backfill.lambda_handler"
+  runtime          = local.runtime
+  architectures    = [local.architecture]
+  role             = local.role_arn
+  source_code_hash = filebase64sha256("backfill.zip")
+  timeout          = 900
+  layers           = [local.layer_arn]
+}
+
 resource "aws_lambda_function" "signup" {
   function_name    = "signup"
   filename         = "signup.zip"                             
@@ -360,6 +373,15 @@ resource "aws_cloudwatch_log_group" "lambda_getnews" {
   }
 }
 
+resource "aws_cloudwatch_log_group" "lambda_backfill" {
+  name              = "/aws/lambda/${aws_lambda_function.backfill.function_name}"
+  retention_in_days = 7
+
+  lifecycle {
+    ignore_changes = [retention_in_days]
+  }
+}
+
 resource "aws_cloudwatch_log_group" "lambda_signup" {
   name              = "/aws/lambda/${aws_lambda_function.signup.function_name}"
   retention_in_days = 7